@@ -1,14 +1,24 @@
 # api/index.py
 import bisect
 import csv
-import io
+import functools
+import hashlib
+import heapq
 import math
+import multiprocessing
+import operator
 import os
 import random
+import re
 import shutil
+import sys
 import tempfile
+import threading
 import uuid
-from collections import Counter, defaultdict
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 
 from flask import Flask, jsonify, request, send_file
 
@@ -79,8 +89,59 @@ if not IS_VERCEL:
     except Exception:
         HAS_PYSAM = False
 
+# orjson serializes large row payloads much faster than the stdlib encoder behind jsonify.
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except Exception:
+    HAS_ORJSON = False
+
 _CCRE_INDEX = None
 
+# Idle pysam.TabixFile handles per built-in GTF path. A handle is checked out by one
+# request at a time (pysam handles are not thread-safe) and returned afterwards, so
+# the BGZF file and .tbi index are only opened once per concurrent request.
+_TABIX_POOL = defaultdict(list)
+_TABIX_POOL_LOCK = threading.Lock()
+
+# Where uploaded GTF/TBI pairs are staged; point at a tmpfs (e.g. /dev/shm) to keep them in memory.
+UPLOAD_TMPDIR = os.getenv("ANNOTATE_UPLOAD_TMPDIR") or None
+UPLOAD_COPY_BUFFER = 1 << 20
+
+# Staged custom GTF/TBI pairs are kept by content hash (LRU), so repeat annotations against
+# the same upload skip re-staging it and reuse the pooled tabix handles. Entries are pinned
+# while a request uses them and only unpinned ones are evicted. Each server process stages
+# into its own gtf_cache/<pid>/ directory and removes those of exited processes on first use.
+GTF_CACHE_DIR = os.path.join(UPLOAD_TMPDIR or tempfile.gettempdir(), "gtf_cache")
+GTF_CACHE_SIZE = max(1, int(os.getenv("ANNOTATE_GTF_CACHE_SIZE", "4")))
+_GTF_CACHE = OrderedDict()  # content key -> {"path": gtf_path, "pins": active requests}
+_GTF_CACHE_LOCK = threading.Lock()
+_GTF_CACHE_PROC_DIR = None
+
+# Chromosomes of one request are annotated concurrently on a shared thread pool;
+# pysam releases the GIL while reading and decompressing BGZF blocks. With
+# ANNOTATE_EXECUTOR=process a pool of ANNOTATE_PROCESSES worker processes is used instead,
+# which also runs the pure-Python sweep and scoring in parallel.
+ANNOTATE_THREADS = max(1, int(os.getenv("ANNOTATE_THREADS", min(8, os.cpu_count() or 1))))
+ANNOTATE_USE_PROCESSES = os.getenv("ANNOTATE_EXECUTOR", "thread") == "process" and not IS_VERCEL
+ANNOTATE_PROCESSES = max(1, int(os.getenv("ANNOTATE_PROCESSES", min(8, os.cpu_count() or 1))))
+_ANNOTATE_EXECUTOR = None
+_ANNOTATE_EXECUTOR_LOCK = threading.Lock()
+
+# GTF feature types that contribute to transcript/exon/CDS overlap; all others are skipped.
+# Exon/CDS map to their [total, covered] offset in a coverage record, transcripts to -1.
+ANNOTATED_FEATURES = {"transcript": -1, "exon": 0, "CDS": 2}
+
+# Only the GTF/GFF attributes the annotator reads; everything else on the line is skipped.
+GTF_ATTR_RE = re.compile(
+    r'(?:^|;)\s*(transcript_id|transcript_biotype|transcript_type|transcript|gene_id|gene_name'
+    r'|gene_biotype|gene_type|gene|Name)(?: +|=)"?([^";]*)"?'
+)
+
+# BED intervals on the same chromosome closer than this (bp) share one tabix fetch.
+FETCH_MERGE_GAP = 1000
+
 CSV_FIELDS = [
     "region_id",
     "input_chr",
@@ -102,6 +163,37 @@ CSV_FIELDS = [
     "ccre_ids",
     "ccre_max_overlap_bp",
 ]
+_CSV_ROW = operator.itemgetter(*CSV_FIELDS)
+CSV_WRITE_BUFFER = 1 << 20
+
+# Inline result rows are streamed to the client this many at a time.
+JSON_STREAM_BATCH = 1000
+
+# BED lines with coordinates outside the signed 64-bit range are skipped like other malformed
+# lines: they are no valid position, and orjson would fail on them halfway through a stream.
+BED_COORD_LIMIT = 1 << 63
+
+# /download only serves the CSVs written by _write_csv.
+DOWNLOAD_NAME_RE = re.compile(r"annotations_[0-9a-f]{32}\.csv")
+
+# CSV downloads are gzip-compressed on the fly for clients that accept it; level 1 already
+# shrinks the highly repetitive CSV several-fold at a fraction of the CPU cost of higher levels.
+DOWNLOAD_GZIP_LEVEL = 1
+
+# Biotype priority rules, checked in this order (exact, then suffix, then prefix); lower ranks win.
+_BIOTYPE_EXACT_RANKS = {"protein_coding": 0, "antisense": 6}
+_BIOTYPE_SUFFIX_RANKS = (("RNA", 2), ("_decay", 3))
+_BIOTYPE_PREFIX_RANKS = (("sense_", 4), ("translated_", 7), ("transcribed_", 8))
+_BIOTYPE_DEFAULT_RANK = 5
+
+# Transcript length bonus: 5 points per decade of length, capped at 10.
+_LOG10 = math.log(10)
+
+# Exon/CDS lines in the usual Ensembl layout are matched on this tag instead of the attribute regex.
+_TX_ID_TAG = 'transcript_id "'
+
+# Coverage record of a transcript with no exon/CDS overlap: [exon_total, exon_cov, cds_total, cds_cov].
+_NO_COVERAGE = (0, 0, 0, 0)
 
 
 # ----------------------- Shared helpers -----------------------
@@ -112,21 +204,41 @@ def normalize_chrom(chrom: str) -> str:
     return chrom
 
 
+def contig_key(chrom: str) -> str:
+    chrom = normalize_chrom(chrom)
+    return "M" if chrom.upper() in {"M", "MT"} else chrom
+
+
+def reference_contigs(contigs) -> dict:
+    """Map contig_key() names to the contig names used by a reference (chr-prefixed or not)."""
+    mapping = {}
+    for contig in contigs:
+        mapping.setdefault(contig_key(contig), contig)
+    return mapping
+
+
 def parse_bed(file_bytes: bytes):
+    # Works on the raw bytes; each distinct chromosome token is decoded and normalized once.
+    # This plain loop measured faster than a whole-buffer regex scan or column-wise int()
+    # conversion; building the interval dicts is the dominant cost either way.
     intervals = []
-    for line in io.BytesIO(file_bytes).read().decode(errors="ignore").splitlines():
-        if not line or line.startswith(("track", "browser", "#")):
+    chrom_names = {}
+    for line in file_bytes.split(b"\n"):
+        if not line or line.startswith((b"track", b"browser", b"#")):
             continue
-        parts = line.split()
+        parts = line.split(None, 3)
         if len(parts) < 3:
             continue
-        chrom = normalize_chrom(parts[0])
         try:
             start = int(parts[1])
             end = int(parts[2])
         except ValueError:
             continue
-        if end > start:
+        if end > start and start >= -BED_COORD_LIMIT and end < BED_COORD_LIMIT:
+            chrom = chrom_names.get(parts[0])
+            if chrom is None:
+                token = parts[0][3:] if parts[0][:3].lower() == b"chr" else parts[0]
+                chrom = chrom_names[parts[0]] = sys.intern(token.decode(errors="ignore"))
             intervals.append(
                 {
                     "region_id": len(intervals) + 1,
@@ -139,6 +251,40 @@ def parse_bed(file_bytes: bytes):
     return intervals
 
 
+def json_response(payload):
+    if HAS_ORJSON:
+        return app.response_class(_json_bytes(payload), mimetype="application/json")
+    return jsonify(payload)
+
+
+def json_stream_response(payload, key, items):
+    """
+    Respond with `payload` plus a `key` array that is encoded and sent in batches,
+    so a large result never exists as one encoded document in memory.
+    """
+    head = _json_bytes(payload)[:-1] + (b"," if payload else b"") + _json_bytes(key) + b":["
+
+    def generate():
+        yield head
+        for offset in range(0, len(items), JSON_STREAM_BATCH):
+            batch = _json_bytes(items[offset : offset + JSON_STREAM_BATCH], str_keys=True)[1:-1]
+            yield batch if offset == 0 else b"," + batch
+        yield b"]}"
+
+    return app.response_class(generate(), mimetype="application/json")
+
+
+def _json_bytes(value, str_keys=False):
+    # Result rows only have str keys; orjson's non-str key support costs ~30% on them.
+    if HAS_ORJSON:
+        try:
+            return orjson.dumps(value) if str_keys else orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # e.g. an integer beyond 64 bits; the stdlib encoder still produces valid JSON.
+            pass
+    return app.json.dumps(value).encode("utf-8")
+
+
 def json_error(msg, code=400):
     return jsonify({"error": msg}), code
 
@@ -165,6 +311,10 @@ def requested_ccre_permutation():
     return run, max(1, min(permutations, 5000))
 
 
+def requested_inline_rows():
+    return truthy(request.values.get("inline"), default=True)
+
+
 def safe_pct(numerator, denominator):
     return round(100.0 * numerator / denominator, 3) if denominator else 0
 
@@ -174,56 +324,97 @@ def mean(values):
     return round(sum(values) / len(values), 3) if values else 0
 
 
-def attr_dict(attr_str: str) -> dict:
-    attrs = {}
-    for field in attr_str.strip().split(";"):
-        field = field.strip()
-        if not field:
-            continue
-        if " " in field:
-            key, value = field.split(" ", 1)
-            attrs[key] = value.strip().strip('"')
-        elif "=" in field:
-            key, value = field.split("=", 1)
-            attrs[key] = value.strip().strip('"')
-    return attrs
-
-
 def overlap_len(a1, a2, b1, b2):
     return max(0, min(a2, b2) - max(a1, b1))
 
 
 def biotype_rank(biotype: str) -> int:
+    rank = BIOTYPE_RANKS.get(biotype)
+    return rank if rank is not None else _biotype_rule_rank(biotype)
+
+
+@functools.lru_cache(maxsize=1024)
+def _biotype_rule_rank(biotype: str) -> int:
     if not biotype:
-        return 5
-    if biotype == "protein_coding":
-        return 0
-    if biotype.endswith("RNA"):
-        return 2
-    if biotype.endswith("_decay"):
-        return 3
-    if biotype.startswith("sense_"):
-        return 4
-    if biotype == "antisense":
-        return 6
-    if biotype.startswith("translated_"):
-        return 7
-    if biotype.startswith("transcribed_"):
-        return 8
-    return 5
-
-
-def score_transcript(tx_pct, cds_pct, exon_pct, biotype, has_hugo, tx_len):
-    score = 3.0 * tx_pct + 2.0 * cds_pct + 1.5 * exon_pct
-    score += max(0, 50 - 10 * biotype_rank(biotype))
-    if has_hugo:
-        score += 5.0
-    if tx_len:
-        try:
-            score += min(10.0, math.log1p(tx_len) / math.log(10) * 5.0)
-        except Exception:
-            pass
-    return score
+        return _BIOTYPE_DEFAULT_RANK
+    rank = _BIOTYPE_EXACT_RANKS.get(biotype)
+    if rank is not None:
+        return rank
+    for suffix, rank in _BIOTYPE_SUFFIX_RANKS:
+        if biotype.endswith(suffix):
+            return rank
+    for prefix, rank in _BIOTYPE_PREFIX_RANKS:
+        if biotype.startswith(prefix):
+            return rank
+    return _BIOTYPE_DEFAULT_RANK
+
+
+# Ensembl/GENCODE biotypes resolved by a dict lookup; unseen values fall back to the rules above.
+# The table is built from _biotype_rule_rank, so the two can never disagree.
+BIOTYPE_RANKS = {
+    biotype: _biotype_rule_rank(biotype)
+    for biotype in (
+        "protein_coding",
+        "lncRNA",
+        "lincRNA",
+        "antisense_RNA",
+        "miRNA",
+        "misc_RNA",
+        "snRNA",
+        "snoRNA",
+        "scaRNA",
+        "scRNA",
+        "sRNA",
+        "rRNA",
+        "vault_RNA",
+        "Mt_rRNA",
+        "Mt_tRNA",
+        "nonsense_mediated_decay",
+        "non_stop_decay",
+        "sense_intronic",
+        "sense_overlapping",
+        "antisense",
+        "translated_processed_pseudogene",
+        "translated_unprocessed_pseudogene",
+        "transcribed_processed_pseudogene",
+        "transcribed_unitary_pseudogene",
+        "transcribed_unprocessed_pseudogene",
+        "processed_transcript",
+        "retained_intron",
+        "processed_pseudogene",
+        "unprocessed_pseudogene",
+        "unitary_pseudogene",
+        "polymorphic_pseudogene",
+        "TEC",
+        "ribozyme",
+        "IG_C_gene",
+        "IG_D_gene",
+        "IG_J_gene",
+        "IG_V_gene",
+        "TR_C_gene",
+        "TR_D_gene",
+        "TR_J_gene",
+        "TR_V_gene",
+    )
+}
+
+
+def transcript_bonus(biotype, has_hugo, tx_len):
+    """
+    Score terms that depend only on the transcript; computed once per transcript, not per
+    region. Returned as (rank, hugo, length) so score_transcript can add them one at a time
+    in the original order and keep the rounded scores unchanged.
+    """
+    rank_term = max(0, 50 - 10 * biotype_rank(biotype))
+    hugo_term = 5.0 if has_hugo else 0.0
+    # tx_len is never negative, so log1p cannot raise.
+    length_term = min(10.0, math.log1p(tx_len) / _LOG10 * 5.0) if tx_len else 0.0
+    return rank_term, hugo_term, length_term
+
+
+def score_transcript(tx_pct, cds_pct, exon_pct, bonus):
+    rank_term, hugo_term, length_term = bonus
+    return 3.0 * tx_pct + 2.0 * cds_pct + 1.5 * exon_pct + rank_term + hugo_term + length_term
 
 
 def reference_payload():
@@ -307,6 +498,9 @@ def _load_ccre_index():
 
     by_chrom = defaultdict(list)
     catalog_counts = Counter()
+    chrom_names = {}
+    # Only a handful of cCRE classes exist; every entry shares one str per class.
+    ccre_types = {}
     total = 0
 
     with open(CCRE_PATH, "r", encoding="utf-8", errors="ignore") as handle:
@@ -324,10 +518,13 @@ def _load_ccre_index():
             if end <= start:
                 continue
 
-            chrom = normalize_chrom(parts[0])
+            chrom = chrom_names.get(parts[0])
+            if chrom is None:
+                chrom = chrom_names[parts[0]] = sys.intern(normalize_chrom(parts[0]))
             ccre_id = parts[3] if len(parts) > 3 else ""
             encode_id = parts[4] if len(parts) > 4 else ""
             ccre_type = parts[5] if len(parts) > 5 else "cCRE"
+            ccre_type = ccre_types.setdefault(ccre_type, ccre_type)
             by_chrom[chrom].append((start, end, ccre_type, ccre_id, encode_id))
             catalog_counts[ccre_type] += 1
             total += 1
@@ -350,11 +547,12 @@ def _load_ccre_index():
 
 
 def _query_ccres(chrom, start, end):
+    # `chrom` is already normalized: intervals come from parse_bed.
     index = _load_ccre_index()
     if not index:
         return []
 
-    chrom_index = index["by_chrom"].get(normalize_chrom(chrom))
+    chrom_index = index["by_chrom"].get(chrom)
     if not chrom_index:
         return []
 
@@ -383,6 +581,15 @@ def _query_ccres(chrom, start, end):
     return overlaps
 
 
+def _overlapping_ccre_types(chrom_index, start, end):
+    """Distinct cCRE classes overlapping [start, end); the permutation test needs nothing else."""
+    starts = chrom_index["starts"]
+    lo = bisect.bisect_left(starts, max(0, start - chrom_index["max_len"]))
+    hi = bisect.bisect_left(starts, end, lo)
+    # Every item in [lo, hi) starts before `end`, so it overlaps iff it ends after `start`.
+    return {item[2] for item in chrom_index["items"][lo:hi] if item[1] > start and item[2]}
+
+
 def _annotate_ccres(
     intervals,
     genome,
@@ -409,8 +616,12 @@ def _annotate_ccres(
         if eligible_region_ids is None or interval["region_id"] in eligible_region_ids
     ]
 
+    queried = {}
     for interval in tested_intervals:
-        overlaps = _query_ccres(interval["chrom"], interval["start"], interval["end"])
+        key = (interval["chrom"], interval["start"], interval["end"])
+        overlaps = queried.get(key)
+        if overlaps is None:
+            overlaps = queried[key] = _query_ccres(*key)
         if not overlaps:
             continue
         by_region[interval["region_id"]] = overlaps
@@ -512,6 +723,7 @@ def _run_ccre_permutation(tested_intervals, observed_region_counts, num_permutat
     rng = random.Random(seed)
     widths = [max(1, interval["end"] - interval["start"]) for interval in tested_intervals]
     choice_cache = {}
+    by_chrom = index["by_chrom"]
 
     for _ in range(num_permutations):
         perm_counts = Counter()
@@ -519,8 +731,12 @@ def _run_ccre_permutation(tested_intervals, observed_region_counts, num_permutat
             random_interval = _random_interval_for_width(width, rng, choice_cache)
             if not random_interval:
                 continue
-            overlaps = _query_ccres(random_interval["chrom"], random_interval["start"], random_interval["end"])
-            for ccre_type in {overlap["type"] for overlap in overlaps if overlap.get("type")}:
+            chrom_index = by_chrom.get(random_interval["chrom"])
+            if not chrom_index:
+                continue
+            for ccre_type in _overlapping_ccre_types(
+                chrom_index, random_interval["start"], random_interval["end"]
+            ):
                 perm_counts[ccre_type] += 1
 
         for ccre_class in classes:
@@ -582,44 +798,58 @@ def _build_summary(intervals, rows, ccre_by_region):
     region_count = len(intervals)
     by_chrom = Counter(interval["chrom"] for interval in intervals)
     lengths = [interval["size"] for interval in intervals]
-    matched_region_ids = {
-        row["region_id"]
-        for row in rows
-        if row.get("gene") or row.get("hugo") or row.get("ensembl_id")
-    }
-    genes = {
-        row.get("hugo") or row.get("gene")
-        for row in rows
-        if row.get("hugo") or row.get("gene")
-    }
-    by_biotype = Counter(row.get("feature_biotype") for row in rows if row.get("feature_biotype"))
-    biotype_region_counts = Counter()
 
-    rows_by_region = defaultdict(list)
+    # Row-level rollups in one pass; regions are classed by their strongest overlap
+    # (3 CDS, 2 exonic non-CDS, 1 transcript/intronic).
+    matched_region_ids = set()
+    genes = set()
+    by_biotype = Counter()
+    region_biotypes = defaultdict(set)
+    region_levels = {}
+    gene_rows = []
     for row in rows:
-        rows_by_region[row["region_id"]].append(row)
+        region_id = row["region_id"]
+        gene = row.get("hugo") or row.get("gene")
+        if gene:
+            genes.add(gene)
+            gene_rows.append(row)
+            matched_region_ids.add(region_id)
+        elif row.get("ensembl_id"):
+            matched_region_ids.add(region_id)
+        biotype = row.get("feature_biotype")
+        if biotype:
+            by_biotype[biotype] += 1
+            region_biotypes[region_id].add(biotype)
+        if (row.get("cds_overlap_pct") or 0) > 0:
+            level = 3
+        elif (row.get("exon_overlap_pct") or 0) > 0:
+            level = 2
+        elif (row.get("tx_overlap_pct") or 0) > 0:
+            level = 1
+        else:
+            continue
+        if level > region_levels.get(region_id, 0):
+            region_levels[region_id] = level
 
-    for region_rows in rows_by_region.values():
-        for biotype in {row.get("feature_biotype") for row in region_rows if row.get("feature_biotype")}:
-            biotype_region_counts[biotype] += 1
+    biotype_region_counts = Counter(
+        biotype for region_set in region_biotypes.values() for biotype in region_set
+    )
 
     region_classes = Counter()
     for interval in intervals:
         region_id = interval["region_id"]
-        region_rows = rows_by_region.get(region_id, [])
-        if any(float(row.get("cds_overlap_pct") or 0) > 0 for row in region_rows):
+        level = region_levels.get(region_id, 0)
+        if level == 3:
             region_classes["CDS overlap"] += 1
-        elif any(float(row.get("exon_overlap_pct") or 0) > 0 for row in region_rows):
+        elif level == 2:
             region_classes["exonic non-CDS"] += 1
-        elif any(float(row.get("tx_overlap_pct") or 0) > 0 for row in region_rows):
+        elif level == 1:
             region_classes["transcript/intronic"] += 1
         elif ccre_by_region.get(region_id):
             region_classes["cCRE only"] += 1
         else:
             region_classes["unannotated"] += 1
 
-    gene_rows = [row for row in rows if row.get("gene") or row.get("hugo")]
-
     return {
         "total_regions": region_count,
         "reported_rows": len(rows),
@@ -641,29 +871,31 @@ def _build_summary(intervals, rows, ccre_by_region):
 
 def _write_csv(rows):
     outpath = os.path.join(tempfile.gettempdir(), f"annotations_{uuid.uuid4().hex}.csv")
-    with open(outpath, "w", newline="", encoding="utf-8") as handle:
-        writer = csv.DictWriter(handle, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow({key: row.get(key) for key in CSV_FIELDS})
+    with open(outpath, "w", newline="", encoding="utf-8", buffering=CSV_WRITE_BUFFER) as handle:
+        # Rows always carry every CSV field, so plain tuples via itemgetter replace DictWriter.
+        writer = csv.writer(handle)
+        writer.writerow(CSV_FIELDS)
+        writer.writerows(map(_CSV_ROW, rows))
     return outpath
 
 
 def _response_payload(rows, intervals, ccre_by_region, ccre_summary, csv_path, genome, source):
     ref = REFERENCE_GENOMES.get(genome, {})
-    return jsonify(
-        {
-            "rows": rows,
-            "summary": _build_summary(intervals, rows, ccre_by_region),
-            "ccre": ccre_summary,
-            "csv_download_path": csv_path,
-            "reference": {
-                "genome": genome,
-                "label": ref.get("label", "Custom reference"),
-                "source": source,
-            },
-        }
-    )
+    payload = {
+        "summary": _build_summary(intervals, rows, ccre_by_region),
+        "ccre": ccre_summary,
+        "csv_download_path": csv_path,
+        "row_count": len(rows),
+        "reference": {
+            "genome": genome,
+            "label": ref.get("label", "Custom reference"),
+            "source": source,
+        },
+    }
+    # Large results can skip the inline rows and rely on the CSV download instead.
+    if requested_inline_rows():
+        return json_stream_response(payload, "rows", rows)
+    return json_response(payload)
 
 
 # ----------------------- DEMO (serverless-safe) -----------------------
@@ -731,154 +963,36 @@ def _annotate_with_pysam():
     run_ccre_permutation, ccre_permutations = requested_ccre_permutation()
     reference_mode = request.form.get("reference_mode", "builtin")
 
-    tbx = None
-    tmpdir = None
     source = "built-in"
+    cache_key = None
     try:
         if reference_mode == "custom" or request.files.get("gtf_bgz"):
             gtf_bgz = request.files.get("gtf_bgz")
             gtf_tbi = request.files.get("gtf_tbi")
             if not gtf_bgz or not gtf_tbi:
                 return json_error("Please upload both GTF (.gtf.bgz) and its .tbi index")
-            tbx, tmpdir = _open_gtf_pair(gtf_bgz, gtf_tbi)
+            cache_key, gtf_path = _pin_cached_gtf(gtf_bgz, gtf_tbi)
             source = "custom upload"
         else:
-            tbx = _open_builtin_reference(genome)
-
-        intervals = parse_bed(bed_file.read())
-        rows = []
-
-        for interval in intervals:
-            chrom = interval["chrom"]
-            start0 = interval["start"]
-            end0 = interval["end"]
-            transcripts = {}
-            exons_by_tx = defaultdict(list)
-            cds_by_tx = defaultdict(list)
-            found_transcript = False
-
-            for chrom_alt in (chrom, f"chr{chrom}"):
-                try:
-                    iterator = tbx.fetch(chrom_alt, start0, end0)
-                except ValueError:
-                    continue
-                for line in iterator:
-                    parts = line.rstrip("\n").split("\t")
-                    if len(parts) < 9:
-                        continue
-                    _seq, _src, feature_type, fstart, fend, _score, strand, _phase, attrs = parts
-                    try:
-                        fstart = int(fstart)
-                        fend = int(fend)
-                    except ValueError:
-                        continue
-                    if overlap_len(start0, end0, fstart - 1, fend) <= 0:
-                        continue
-
-                    parsed_attrs = attr_dict(attrs)
-                    tx_id = parsed_attrs.get("transcript_id") or parsed_attrs.get("transcript")
-                    gene_id = parsed_attrs.get("gene_id") or parsed_attrs.get("gene")
-                    gene_name = parsed_attrs.get("gene_name") or parsed_attrs.get("Name")
-                    biotype = (
-                        parsed_attrs.get("transcript_biotype")
-                        or parsed_attrs.get("transcript_type")
-                        or parsed_attrs.get("gene_biotype")
-                        or parsed_attrs.get("gene_type")
-                    )
-
-                    if feature_type == "transcript" and tx_id:
-                        found_transcript = True
-                        transcripts[tx_id] = {
-                            "tx_id": tx_id,
-                            "gene_id": gene_id,
-                            "gene_name": gene_name,
-                            "biotype": biotype,
-                            "strand": strand,
-                            "tstart": fstart,
-                            "tend": fend,
-                        }
-                    elif feature_type == "exon" and tx_id:
-                        exons_by_tx[tx_id].append((fstart, fend))
-                    elif feature_type == "CDS" and tx_id:
-                        cds_by_tx[tx_id].append((fstart, fend))
-                if found_transcript:
-                    break
-
-            candidates = []
-            for tx_id, info in transcripts.items():
-                tstart, tend = info["tstart"], info["tend"]
-                tx_total = max(0, tend - tstart + 1)
-                tx_ol = overlap_len(start0, end0, tstart - 1, tend)
-                tx_pct = safe_pct(tx_ol, tx_total)
-
-                exons = exons_by_tx.get(tx_id, [])
-                exon_cov = sum(overlap_len(start0, end0, exon_start - 1, exon_end) for exon_start, exon_end in exons)
-                exon_total = sum(exon_end - exon_start + 1 for exon_start, exon_end in exons)
-                exon_pct = safe_pct(exon_cov, exon_total)
-
-                cds_parts = cds_by_tx.get(tx_id, [])
-                cds_cov = sum(overlap_len(start0, end0, cds_start - 1, cds_end) for cds_start, cds_end in cds_parts)
-                cds_total = sum(cds_end - cds_start + 1 for cds_start, cds_end in cds_parts)
-                cds_pct = safe_pct(cds_cov, cds_total)
-
-                score = score_transcript(
-                    tx_pct,
-                    cds_pct,
-                    exon_pct,
-                    info["biotype"],
-                    bool(info["gene_name"]),
-                    tx_total,
-                )
+            gtf_path = _builtin_reference_path(genome)
 
-                candidates.append(
-                    {
-                        "region_id": interval["region_id"],
-                        "input_chr": chrom,
-                        "input_start": start0,
-                        "input_end": end0,
-                        "region_size": interval["size"],
-                        "gene": info["gene_id"],
-                        "strand": info["strand"],
-                        "feature_biotype": info["biotype"],
-                        "ensembl_id": tx_id,
-                        "hugo": info["gene_name"],
-                        "tx_overlap_pct": tx_pct,
-                        "exon_overlap_pct": exon_pct,
-                        "cds_overlap_pct": cds_pct,
-                        "priority_score": round(score, 3),
-                    }
-                )
+        tbx = _acquire_tabix(gtf_path)
+        try:
+            contigs = reference_contigs(tbx.contigs)
+        finally:
+            _release_tabix(gtf_path, tbx)
 
-            if not candidates:
-                rows.append(
-                    {
-                        "region_id": interval["region_id"],
-                        "input_chr": chrom,
-                        "input_start": start0,
-                        "input_end": end0,
-                        "region_size": interval["size"],
-                        "gene": None,
-                        "strand": None,
-                        "feature_biotype": None,
-                        "ensembl_id": None,
-                        "hugo": None,
-                        "tx_overlap_pct": 0,
-                        "exon_overlap_pct": 0,
-                        "cds_overlap_pct": 0,
-                        "priority_score": 0,
-                    }
-                )
-                continue
+        intervals = parse_bed(bed_file.read())
+        hits = _collect_hits(gtf_path, contigs, intervals)
 
-            candidates.sort(key=lambda row: row["priority_score"], reverse=True)
-            if ambiguities == "all":
-                picks = candidates
-            elif ambiguities == "best_one":
-                picks = [candidates[0]]
-            else:
-                top = candidates[0]["priority_score"]
-                picks = [row for row in candidates if abs(row["priority_score"] - top) < 1e-6]
-            rows.extend(picks)
+        if ambiguities == "best_one":
+            # Exactly one row per region.
+            rows = [_interval_rows(interval, hits[interval["region_id"]], ambiguities)[0] for interval in intervals]
+        else:
+            rows = []
+            extend_rows = rows.extend
+            for interval in intervals:
+                extend_rows(_interval_rows(interval, hits[interval["region_id"]], ambiguities))
 
         matched_region_ids = {
             row["region_id"]
@@ -909,33 +1023,425 @@ def _annotate_with_pysam():
     except Exception as exc:
         return json_error(f"Annotation failed: {exc}", 500)
     finally:
+        if cache_key:
+            _unpin_cached_gtf(cache_key)
+
+
+def _annotation_executor():
+    global _ANNOTATE_EXECUTOR
+    with _ANNOTATE_EXECUTOR_LOCK:
+        if _ANNOTATE_EXECUTOR is None:
+            if ANNOTATE_USE_PROCESSES:
+                # The pool is created from a request thread; forking there could copy locks held
+                # by other threads (logging, htslib, the tabix pool), so workers come from a
+                # forkserver (spawn where that is unavailable).
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _ANNOTATE_EXECUTOR = ProcessPoolExecutor(
+                    max_workers=ANNOTATE_PROCESSES,
+                    mp_context=multiprocessing.get_context(method),
+                )
+            else:
+                _ANNOTATE_EXECUTOR = ThreadPoolExecutor(max_workers=ANNOTATE_THREADS, thread_name_prefix="annotate")
+    return _ANNOTATE_EXECUTOR
+
+
+def _reset_annotation_executor(broken):
+    """Drop a pool that lost a worker process, unless another request already replaced it."""
+    global _ANNOTATE_EXECUTOR
+    with _ANNOTATE_EXECUTOR_LOCK:
+        if _ANNOTATE_EXECUTOR is broken:
+            _ANNOTATE_EXECUTOR = None
+    broken.shutdown(wait=False)
+
+
+def _collect_hits(gtf_path, contigs, intervals):
+    """Group intervals by chromosome and collect GTF hits per chromosome, in parallel when possible."""
+    by_chrom = defaultdict(list)
+    for interval in intervals:
+        by_chrom[interval["chrom"]].append(interval)
+    jobs = [
+        (gtf_path, contigs.get(contig_key(chrom)), chrom_intervals)
+        for chrom, chrom_intervals in by_chrom.items()
+    ]
+
+    workers = ANNOTATE_PROCESSES if ANNOTATE_USE_PROCESSES else ANNOTATE_THREADS
+    if len(jobs) > 1 and workers > 1:
+        executor = _annotation_executor()
         try:
-            if tbx:
-                tbx.close()
-        except Exception:
-            pass
-        if tmpdir:
-            shutil.rmtree(tmpdir, ignore_errors=True)
+            results = _run_chrom_jobs(executor, jobs)
+        except BrokenProcessPool:
+            # A worker process died (e.g. killed for memory) and the pool cannot run anything
+            # anymore; start a fresh one and retry once, so only this request can still fail.
+            _reset_annotation_executor(executor)
+            results = _run_chrom_jobs(_annotation_executor(), jobs)
+    else:
+        results = (_annotate_chrom(*job) for job in jobs)
+
+    hits = {}
+    for chrom_hits in results:
+        hits.update(chrom_hits)
+    return hits
+
+
+def _run_chrom_jobs(executor, jobs):
+    # Worker processes open a handle per job rather than keeping a pool of their own.
+    pooled = not ANNOTATE_USE_PROCESSES
+    futures = [executor.submit(_annotate_chrom, *job, pooled) for job in jobs]
+    # Let every job finish before raising, so the caller never unpins (and possibly evicts)
+    # a cached GTF while other chromosomes are still reading it.
+    wait(futures)
+    return [future.result() for future in futures]
+
+
+def _annotate_chrom(gtf_path, ref_chrom, chrom_intervals, pooled=True):
+    if ref_chrom is None:
+        return {interval["region_id"]: _empty_hit() for interval in chrom_intervals}
+
+    chrom_intervals.sort(key=lambda interval: interval["start"])
+    # Repeated intervals (e.g. concatenated cohorts) are annotated once and share one hit.
+    unique = {}
+    for interval in chrom_intervals:
+        unique.setdefault((interval["start"], interval["end"]), interval)
+
+    hits = {}
+    tbx = _acquire_tabix(gtf_path) if pooled else pysam.TabixFile(gtf_path)
+    try:
+        for range_start, range_end, members in _merge_fetch_ranges(list(unique.values())):
+            hits.update(_collect_range_hits(tbx, ref_chrom, range_start, range_end, members))
+    finally:
+        if pooled:
+            _release_tabix(gtf_path, tbx)
+        else:
+            tbx.close()
+
+    if len(unique) < len(chrom_intervals):
+        for interval in chrom_intervals:
+            first = unique[(interval["start"], interval["end"])]
+            hits[interval["region_id"]] = hits[first["region_id"]]
+    return hits
+
+
+def _merge_fetch_ranges(chrom_intervals, gap=FETCH_MERGE_GAP):
+    """Merge start-sorted intervals into [start, end, members] ranges, one tabix fetch each."""
+    ranges = []
+    for interval in chrom_intervals:
+        if ranges and interval["start"] <= ranges[-1][1] + gap:
+            ranges[-1][1] = max(ranges[-1][1], interval["end"])
+            ranges[-1][2].append(interval)
+        else:
+            ranges.append([interval["start"], interval["end"], [interval]])
+    return ranges
+
+
+def _transcript_table():
+    # Column-wise transcript records of one fetched range; hits refer to them by row index.
+    return {"tstart": [], "tend": [], "tx_total": [], "bonus": [], "info": []}
 
 
-def _open_builtin_reference(genome):
+def _empty_hit(table=None):
+    # transcripts[tx_id] is a row of `table`; coverage[tx_id] is
+    # [exon_total, exon_cov, cds_total, cds_cov] in bp.
+    return {
+        "table": table if table is not None else _transcript_table(),
+        "transcripts": {},
+        "coverage": defaultdict(_zero_coverage),
+    }
+
+
+def _zero_coverage():
+    # Module-level (not a lambda) so hits can be pickled back from worker processes.
+    return [0, 0, 0, 0]
+
+
+def _collect_range_hits(tbx, ref_chrom, range_start, range_end, members):
+    """
+    Fetch one merged range and hand each GTF feature to every member interval it
+    overlaps. Members are sorted by start and tabix yields features sorted by start,
+    so a sweep keeps the members already open at the feature start in a heap keyed by
+    end; expired members are evicted and never revisited, even behind a long member.
+    """
+    # Struct-of-arrays view of the members keeps the sweep on plain int lists.
+    starts = [interval["start"] for interval in members]
+    ends = [interval["end"] for interval in members]
+    table = _transcript_table()
+    member_hits = [_empty_hit(table) for _ in members]
+    member_count = len(members)
+    active = []
+    pending = 0
+    # Raw lines + str.split beat pysam.asTuple()/asGTF() here: the proxies re-create a
+    # Python str on every field access, and five fields are read per kept line.
+    for line in tbx.fetch(ref_chrom, range_start, range_end):
+        parts = line.split("\t", 8)
+        if len(parts) < 9:
+            continue
+        slot = ANNOTATED_FEATURES.get(parts[2])
+        if slot is None:
+            continue
+        _seq, _src, _feature, fstart, fend, _score, strand, _phase, attrs = parts
+        try:
+            fstart = int(fstart)
+            fend = int(fend)
+        except ValueError:
+            continue
+
+        # Overlap in bp is computed once here and reused by the exon/CDS accumulators.
+        fstart0 = fstart - 1
+        while pending < member_count and starts[pending] <= fstart0:
+            heapq.heappush(active, (ends[pending], pending))
+            pending += 1
+        while active and active[0][0] <= fstart0:
+            heapq.heappop(active)
+        # Open members all cover fstart0; members starting inside the feature are
+        # picked up by scanning forward without entering the heap yet.
+        matched = [(idx, min(end, fend) - fstart0) for end, idx in active]
+        idx = pending
+        while idx < member_count and starts[idx] < fend:
+            matched.append((idx, min(ends[idx], fend) - starts[idx]))
+            idx += 1
+        if not matched:
+            continue
+
+        if slot >= 0:
+            # Exon/CDS lines only contribute coverage, so only their transcript_id is read.
+            tx_id = _feature_tx_id(attrs)
+            if tx_id:
+                feature_len = fend - fstart + 1
+                for idx, bp in matched:
+                    coverage = member_hits[idx]["coverage"][tx_id]
+                    coverage[slot] += feature_len
+                    coverage[slot + 1] += bp
+            continue
+
+        tx_id, gene_id, gene_name, biotype = _transcript_attrs(attrs)
+        if tx_id:
+            row = len(table["info"])
+            tx_total = max(0, fend - fstart + 1)
+            table["tstart"].append(fstart)
+            table["tend"].append(fend)
+            table["tx_total"].append(tx_total)
+            table["bonus"].append(transcript_bonus(biotype, bool(gene_name), tx_total))
+            table["info"].append(
+                {
+                    "tx_id": tx_id,
+                    "gene_id": gene_id,
+                    "gene_name": gene_name,
+                    "biotype": biotype,
+                    "strand": strand,
+                }
+            )
+            for idx, _bp in matched:
+                member_hits[idx]["transcripts"][tx_id] = row
+    return {interval["region_id"]: hit for interval, hit in zip(members, member_hits)}
+
+
+def _feature_tx_id(attrs):
+    """transcript_id of a GTF line, by plain string search for the usual `transcript_id "..."` layout."""
+    pos = attrs.find(_TX_ID_TAG)
+    if pos == 0 or (pos > 0 and attrs[pos - 1] in " ;"):
+        pos += len(_TX_ID_TAG)
+        end = attrs.find('"', pos)
+        if end > pos:
+            return attrs[pos:end]
+    # GFF-style or unusual attribute layouts go through the full attribute regex.
+    return _transcript_attrs(attrs)[0]
+
+
+def _transcript_attrs(attrs):
+    """(tx_id, gene_id, gene_name, biotype) of a GTF/GFF attribute column; missing values are None."""
+    parsed = dict(GTF_ATTR_RE.findall(attrs.rstrip("\n")))
+    get = parsed.get
+    return (
+        get("transcript_id") or get("transcript"),
+        get("gene_id") or get("gene"),
+        get("gene_name") or get("Name"),
+        get("transcript_biotype") or get("transcript_type") or get("gene_biotype") or get("gene_type"),
+    )
+
+
+def _interval_rows(interval, hit, ambiguities):
+    start0 = interval["start"]
+    end0 = interval["end"]
+    # Candidates are scored as light tuples; row dicts are only built for the ones reported.
+    # overlap_len/safe_pct are inlined: this loop runs once per (region, transcript) pair.
+    candidates = []
+    coverage = hit["coverage"]
+    table = hit["table"]
+    tstarts, tends, tx_totals, bonuses = table["tstart"], table["tend"], table["tx_total"], table["bonus"]
+    for tx_id, row in hit["transcripts"].items():
+        tx_ol = max(0, min(end0, tends[row]) - max(start0, tstarts[row] - 1))
+        tx_total = tx_totals[row]
+        tx_pct = round(100.0 * tx_ol / tx_total, 3) if tx_total else 0
+
+        exon_total, exon_cov, cds_total, cds_cov = coverage.get(tx_id, _NO_COVERAGE)
+        exon_pct = round(100.0 * exon_cov / exon_total, 3) if exon_total else 0
+        cds_pct = round(100.0 * cds_cov / cds_total, 3) if cds_total else 0
+
+        score = round(score_transcript(tx_pct, cds_pct, exon_pct, bonuses[row]), 3)
+        candidates.append((score, row, tx_pct, exon_pct, cds_pct))
+
+    if not candidates:
+        return [_region_row(interval, None, 0, 0, 0, 0)]
+
+    if ambiguities == "all":
+        picks = sorted(candidates, key=lambda candidate: candidate[0], reverse=True)
+    elif ambiguities == "best_one":
+        picks = [max(candidates, key=lambda candidate: candidate[0])]
+    else:
+        top = max(candidate[0] for candidate in candidates)
+        picks = [candidate for candidate in candidates if abs(candidate[0] - top) < 1e-6]
+        picks.sort(key=lambda candidate: candidate[0], reverse=True)
+    infos = table["info"]
+    return [
+        _region_row(interval, infos[row], tx_pct, exon_pct, cds_pct, score)
+        for score, row, tx_pct, exon_pct, cds_pct in picks
+    ]
+
+
+def _region_row(interval, info, tx_pct, exon_pct, cds_pct, score):
+    info = info or {}
+    return {
+        "region_id": interval["region_id"],
+        "input_chr": interval["chrom"],
+        "input_start": interval["start"],
+        "input_end": interval["end"],
+        "region_size": interval["size"],
+        "gene": info.get("gene_id"),
+        "strand": info.get("strand"),
+        "feature_biotype": info.get("biotype"),
+        "ensembl_id": info.get("tx_id"),
+        "hugo": info.get("gene_name"),
+        "tx_overlap_pct": tx_pct,
+        "exon_overlap_pct": exon_pct,
+        "cds_overlap_pct": cds_pct,
+        "priority_score": score,
+    }
+
+
+def _builtin_reference_path(genome):
     if genome not in REFERENCE_GENOMES:
         raise ValueError(f"Unknown reference genome: {genome}")
     ref = REFERENCE_GENOMES[genome]
     if not os.path.exists(ref["gtf"]) or not os.path.exists(ref["tbi"]):
         raise FileNotFoundError(f"Missing built-in reference files for {ref['label']}")
-    return pysam.TabixFile(ref["gtf"])
+    return ref["gtf"]
+
+
+def _acquire_tabix(path):
+    with _TABIX_POOL_LOCK:
+        if _TABIX_POOL[path]:
+            return _TABIX_POOL[path].pop()
+    return pysam.TabixFile(path)
 
 
-def _open_gtf_pair(gtf_file, tbi_file):
-    tmpdir = tempfile.mkdtemp(prefix="gtf_")
-    base = f"user_{uuid.uuid4().hex}.gtf.bgz"
-    gtf_path = os.path.join(tmpdir, base)
-    tbi_path = gtf_path + ".tbi"
-    gtf_file.save(gtf_path)
-    tbi_file.save(tbi_path)
-    tbx = pysam.TabixFile(gtf_path)
-    return tbx, tmpdir
+def _release_tabix(path, tbx):
+    with _TABIX_POOL_LOCK:
+        _TABIX_POOL[path].append(tbx)
+
+
+def _discard_tabix(path):
+    with _TABIX_POOL_LOCK:
+        handles = _TABIX_POOL.pop(path, [])
+    for tbx in handles:
+        try:
+            tbx.close()
+        except Exception:
+            pass
+
+
+def _pin_cached_gtf(gtf_file, tbi_file):
+    """Stage an uploaded GTF/TBI pair once per distinct content; returns (key, gtf_path), pinned."""
+    key = f"{_upload_digest(gtf_file)}_{_upload_digest(tbi_file)}"
+    with _GTF_CACHE_LOCK:
+        entry = _GTF_CACHE.get(key)
+        if entry is not None:
+            entry["pins"] += 1
+            _GTF_CACHE.move_to_end(key)
+            return key, entry["path"]
+
+    # Every staged copy gets its own directory, so evicting one never removes another's files.
+    cache_dir = tempfile.mkdtemp(prefix="gtf_", dir=_gtf_cache_dir())
+    gtf_path = os.path.join(cache_dir, "user.gtf.bgz")
+    try:
+        gtf_file.save(gtf_path, buffer_size=UPLOAD_COPY_BUFFER)
+        tbi_file.save(gtf_path + ".tbi", buffer_size=UPLOAD_COPY_BUFFER)
+    except Exception:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        raise
+
+    with _GTF_CACHE_LOCK:
+        entry = _GTF_CACHE.setdefault(key, {"path": gtf_path, "pins": 0})
+        entry["pins"] += 1
+        _GTF_CACHE.move_to_end(key)
+        evicted = _evict_cached_gtfs()
+    if entry["path"] != gtf_path:
+        # A concurrent request staged the same pair first.
+        evicted.append(gtf_path)
+    _remove_cached_gtfs(evicted)
+    return key, entry["path"]
+
+
+def _gtf_cache_dir():
+    """This process's staging directory; the first call removes copies left by exited processes."""
+    global _GTF_CACHE_PROC_DIR
+    with _GTF_CACHE_LOCK:
+        if _GTF_CACHE_PROC_DIR is None:
+            os.makedirs(GTF_CACHE_DIR, exist_ok=True)
+            pid = os.getpid()
+            for name in os.listdir(GTF_CACHE_DIR):
+                # Our own pid can only be a leftover of an earlier process that had the same pid.
+                if not name.isdigit() or int(name) == pid or not _pid_alive(int(name)):
+                    shutil.rmtree(os.path.join(GTF_CACHE_DIR, name), ignore_errors=True)
+            _GTF_CACHE_PROC_DIR = os.path.join(GTF_CACHE_DIR, str(pid))
+            os.makedirs(_GTF_CACHE_PROC_DIR, exist_ok=True)
+    return _GTF_CACHE_PROC_DIR
+
+
+def _pid_alive(pid):
+    if os.name != "posix":
+        # os.kill would terminate the process here; leave other processes' copies alone.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _unpin_cached_gtf(key):
+    with _GTF_CACHE_LOCK:
+        _GTF_CACHE[key]["pins"] -= 1
+        evicted = _evict_cached_gtfs()
+    _remove_cached_gtfs(evicted)
+
+
+def _evict_cached_gtfs():
+    """Pop least recently used, unpinned entries beyond GTF_CACHE_SIZE; caller holds _GTF_CACHE_LOCK."""
+    evicted = []
+    for key in list(_GTF_CACHE):
+        if len(_GTF_CACHE) <= GTF_CACHE_SIZE:
+            break
+        if not _GTF_CACHE[key]["pins"]:
+            evicted.append(_GTF_CACHE.pop(key)["path"])
+    return evicted
+
+
+def _remove_cached_gtfs(paths):
+    # Unpinned entries have no checked-out handles, so every handle for them is in the pool.
+    for path in paths:
+        _discard_tabix(path)
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def _upload_digest(upload):
+    digest = hashlib.sha1()
+    stream = upload.stream
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(UPLOAD_COPY_BUFFER), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
 
 
 # ----------------------- Download -----------------------
@@ -947,8 +1453,35 @@ def download():
 
     abs_path = os.path.abspath(path)
     tmp_root = os.path.abspath(tempfile.gettempdir())
-    if not abs_path.startswith(tmp_root + os.sep):
+    # Only CSVs written by _write_csv are served; staged uploads also live under the temp dir.
+    if os.path.dirname(abs_path) != tmp_root or not DOWNLOAD_NAME_RE.fullmatch(os.path.basename(abs_path)):
         return jsonify({"error": "invalid download path"}), 400
     if not os.path.exists(abs_path):
         return jsonify({"error": "file not found"}), 404
-    return send_file(abs_path, as_attachment=True, download_name="annotations.csv")
+
+    if request.accept_encodings["gzip"]:
+        response = app.response_class(_gzip_chunks(abs_path), mimetype="text/csv")
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers.set("Content-Disposition", "attachment", filename="annotations.csv")
+    else:
+        # Served through the WSGI file wrapper (sendfile where the server supports it),
+        # with ETag/Last-Modified and range support.
+        response = send_file(
+            abs_path,
+            as_attachment=True,
+            download_name="annotations.csv",
+            conditional=True,
+            etag=True,
+        )
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _gzip_chunks(path):
+    compressor = zlib.compressobj(DOWNLOAD_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(UPLOAD_COPY_BUFFER), b""):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()